@@ -4,30 +4,19 @@ from __future__ import annotations
 from typing import Any
 
 import httpx
-import streamlit as st
 
 
-def _refresh_jwt(supabase_url: str, anon_key: str) -> str | None:
-    """Refresh JWT via supabase client. Returns new token or None."""
-    try:
-        from supabase import create_client
-        sb = create_client(supabase_url, anon_key)
-        response = sb.auth.refresh_session()
-        if response and response.session:
-            new_token = response.session.access_token
-            st.session_state.access_token = new_token
-            return new_token
-    except Exception:
-        pass
-    return None
+def _refresh_jwt() -> str | None:
+    """Refresh JWT via the suite's auth helper. Returns new token or None."""
+    from app import refresh_jwt
+    return refresh_jwt()
 
 
-def _get_with_retry(url: str, headers: dict, params: dict,
-                    supabase_url: str, anon_key: str) -> list[dict]:
+def _get_with_retry(url: str, headers: dict, params: dict) -> list[dict]:
     """GET with 401 auto-refresh retry."""
     r = httpx.get(url, headers=headers, params=params, timeout=10.0)
     if r.status_code == 401:
-        new_token = _refresh_jwt(supabase_url, anon_key)
+        new_token = _refresh_jwt()
         if new_token:
             headers["Authorization"] = f"Bearer {new_token}"
             r = httpx.get(url, headers=headers, params=params, timeout=10.0)
@@ -67,7 +56,6 @@ def build_page_context(
             headers.copy(),
             {"select": "seo_score,aeo_readiness_score,content_quality_score,priority_action,issues",
              "page_id": f"eq.{page_id}"},
-            supabase_url, anon_key,
         )
         if rows:
             context["crawl_analysis"] = rows[0]
@@ -83,7 +71,6 @@ def build_page_context(
              "page_id": f"eq.{page_id}",
              "order": "date_range_end.desc",
              "limit": "1"},
-            supabase_url, anon_key,
         )
         if rows:
             context["gsc"] = rows[0]
@@ -99,7 +86,6 @@ def build_page_context(
              "page_id": f"eq.{page_id}",
              "order": "date_range_end.desc",
              "limit": "1"},
-            supabase_url, anon_key,
         )
         if rows:
             context["ga"] = rows[0]
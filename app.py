@@ -1,14 +1,25 @@
+from __future__ import annotations
+
 import streamlit as st
-from supabase import create_client
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
 import httpx
-import csv
-import io
-import json
-import time
+import aiohttp
+import orjson
 import os
+import random
+import re
+import time
+import asyncio
+import atexit
+import codecs
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from collections import Counter
+from dataclasses import dataclass
+from functools import lru_cache
 from datetime import date
 from urllib.parse import urlparse
+import pandas as pd
 from dotenv import load_dotenv
 from crawler.crawler_ui import show_crawler
 from google_data.datasources_ui import show_datasources, handle_oauth_callback_if_present
@@ -19,7 +30,9 @@ from arbeidspakker.arbeidspakker_ui import show_arbeidspakker_library
 load_dotenv()
 
 
-# Read from st.secrets (Streamlit Cloud) or .env (local)
+# Read from st.secrets (Streamlit Cloud) or .env (local).
+# Cached so reruns of this script don't repeat the lookups.
+@st.cache_data(show_spinner=False)
 def get_secret(key):
     try:
         return st.secrets[key]
@@ -31,9 +44,6 @@ SUPABASE_URL = get_secret("SUPABASE_URL")
 SUPABASE_ANON_KEY = get_secret("SUPABASE_ANON_KEY")
 PERPLEXITY_API_KEY = get_secret("PERPLEXITY_API_KEY")
 
-# Unauthenticated client for auth operations only
-supabase = create_client(SUPABASE_URL, SUPABASE_ANON_KEY)
-
 st.set_page_config(page_title="Aevilab", page_icon="⬡", layout="wide")
 
 # ---------------------------------------------------------------------------
@@ -540,173 +550,289 @@ def _inject_theme():
 _inject_theme()
 
 
+_SESSION_DEFAULTS = frozenset({
+    "user", "workspace", "access_token", "refresh_token", "error", "selected_project_id",
+})
+
+
 def init_session_state():
-    defaults = {
-        "user": None, "workspace": None, "access_token": None,
-        "refresh_token": None, "error": None, "selected_project_id": None,
-    }
-    for key, val in defaults.items():
-        if key not in st.session_state:
-            st.session_state[key] = val
+    missing = _SESSION_DEFAULTS - st.session_state.keys()
+    if missing:
+        st.session_state.update(dict.fromkeys(missing))
 
 
-def _refresh_jwt():
-    """Refresh the Supabase JWT using the current session. Returns new token or None."""
+def refresh_jwt():
+    """Refresh the Supabase JWT using the stored refresh token. Returns new token or None."""
+    refresh_token = st.session_state.get("refresh_token")
+    if not refresh_token:
+        return None
     try:
-        # Restore session from stored tokens so supabase client has context
-        stored_access = st.session_state.get("access_token")
-        stored_refresh = st.session_state.get("refresh_token")
-        if stored_access and stored_refresh:
-            try:
-                supabase.auth.set_session(stored_access, stored_refresh)
-            except Exception:
-                pass
-        response = supabase.auth.refresh_session()
-        if response and response.session:
-            st.session_state.access_token = response.session.access_token
-            st.session_state.refresh_token = response.session.refresh_token
-            return response.session.access_token
+        data = _auth_call("token", {"refresh_token": refresh_token},
+                          params={"grant_type": "refresh_token"})
     except Exception:
-        pass
-    return None
-
-
-def _make_rest_call(method, url, headers, params=None, body=None):
-    """Execute a single REST call."""
-    if method == "GET":
-        return httpx.get(url, headers=headers, params=params, timeout=30.0)
-    elif method == "POST":
-        return httpx.post(url, headers=headers, json=body, params=params, timeout=30.0)
-    elif method == "PATCH":
-        return httpx.patch(url, headers=headers, json=body, params=params, timeout=30.0)
-    elif method == "DELETE":
-        return httpx.delete(url, headers=headers, params=params, timeout=30.0)
-    else:
-        raise ValueError(f"Unsupported method: {method}")
+        return None
+    st.session_state.access_token = data["access_token"]
+    st.session_state.refresh_token = data["refresh_token"]
+    return data["access_token"]
+
+
+# Sent with every Supabase request; set once on the client
+_STATIC_HEADERS = {
+    "apikey": SUPABASE_ANON_KEY,
+    "Content-Type": "application/json",
+    "Accept-Encoding": "gzip, br",  # br decoding needs the brotli package
+}
+
+
+@st.cache_resource
+def _http_client():
+    """Process-wide keep-alive client for Supabase REST calls.
+    Reusing it avoids a new TCP+TLS handshake per request."""
+    client = httpx.Client(
+        base_url=SUPABASE_URL,
+        headers=_STATIC_HEADERS,
+        # Fail fast on connect; reads keep the 30s budget for large result sets
+        timeout=httpx.Timeout(30.0, connect=5.0),
+        limits=httpx.Limits(max_keepalive_connections=20, max_connections=40,
+                            keepalive_expiry=30.0),
+    )
+    atexit.register(client.close)
+    return client
 
 
-def db_request(method, table, access_token, params=None, body=None):
-    """Direct REST call to Supabase PostgREST with authenticated JWT.
+@lru_cache(maxsize=32)
+def _bearer(access_token):
+    return f"Bearer {access_token}"
+
+
+@lru_cache(maxsize=32)
+def _auth_headers(access_token, prefer=None):
+    """Per-request headers; the static ones live on the shared client.
+    Cached per (token, prefer) as immutable pairs, which httpx accepts."""
+    headers = (("Authorization", _bearer(access_token)),)
+    if prefer:
+        headers += (("Prefer", prefer),)
+    return headers
+
+
+_MAX_ATTEMPTS = 4
+_MAX_RETRY_AFTER = 8
+
+
+def _retry_delay(r, attempt):
+    """Server's Retry-After (capped) plus exponential jitter."""
+    try:
+        retry_after = min(int(r.headers.get("Retry-After", 0)), _MAX_RETRY_AFTER)
+    except ValueError:
+        retry_after = 0
+    return retry_after + random.uniform(0, 0.5 * 2 ** attempt)
+
+
+def _send(client, method, path, headers, params, content):
+    """Send one request, backing off on throttling / gateway errors.
+    429 is retried for any method (the request was rejected unprocessed);
+    502/503/504 only for GET, where repeating is always safe."""
+    for attempt in range(_MAX_ATTEMPTS):
+        r = client.request(method, path, headers=headers, params=params, content=content)
+        retryable = r.status_code == 429 or (
+            method == "GET" and r.status_code in (502, 503, 504))
+        if not retryable or attempt == _MAX_ATTEMPTS - 1:
+            return r
+        time.sleep(_retry_delay(r, attempt))
+    return r
+
+
+def _rest_call(method, path, access_token, params=None, body=None, prefer=None):
+    """Execute a single PostgREST call on the shared client.
     Auto-refreshes token on 401 and retries once."""
-    url = f"{SUPABASE_URL}/rest/v1/{table}"
-    headers = {
-        "apikey": SUPABASE_ANON_KEY,
-        "Authorization": f"Bearer {access_token}",
-        "Content-Type": "application/json",
-        "Prefer": "return=representation",
-    }
-    r = _make_rest_call(method, url, headers, params=params, body=body)
+    if method not in ("GET", "POST", "PATCH", "DELETE"):
+        raise ValueError(f"Unsupported method: {method}")
+    client = _http_client()
+    content = orjson.dumps(body) if body is not None else None
+    r = _send(client, method, path, _auth_headers(access_token, prefer), params, content)
 
     if r.status_code == 401:
-        new_token = _refresh_jwt()
+        new_token = refresh_jwt()
         if new_token:
-            headers["Authorization"] = f"Bearer {new_token}"
-            r = _make_rest_call(method, url, headers, params=params, body=body)
+            r = _send(client, method, path, _auth_headers(new_token, prefer), params, content)
+    return r
+
+
+# Writes return the affected rows; reads send no Prefer header at all
+_WRITE_PREFER = "return=representation"
+
+
+def db_request(method, table, access_token, params=None, body=None):
+    """Direct REST call to Supabase PostgREST with authenticated JWT.
+    Auto-refreshes token on 401 and retries once."""
+    prefer = None if method == "GET" else _WRITE_PREFER
+    r = _rest_call(method, f"/rest/v1/{table}", access_token, params=params, body=body,
+                   prefer=prefer)
 
     if r.status_code >= 400:
         raise Exception(f"DB {method} {table}: {r.status_code} {r.text}")
     if r.status_code == 204:
         return []
-    return r.json()
+    return orjson.loads(r.content)
 
 
-def db_upsert(table, access_token, body, on_conflict):
+def db_upsert(table, access_token, body, on_conflict, ignore_duplicates=False):
     """UPSERT via PostgREST — insert or update on conflict.
+    With ignore_duplicates=True conflicting rows are skipped instead of updated,
+    and only the newly inserted rows are returned.
     Auto-refreshes token on 401 and retries once."""
-    url = f"{SUPABASE_URL}/rest/v1/{table}"
-    headers = {
-        "apikey": SUPABASE_ANON_KEY,
-        "Authorization": f"Bearer {access_token}",
-        "Content-Type": "application/json",
-        "Prefer": "return=representation,resolution=merge-duplicates",
-    }
-    upsert_params = {"on_conflict": on_conflict}
-    r = httpx.post(url, headers=headers, json=body, params=upsert_params, timeout=30.0)
-
-    if r.status_code == 401:
-        new_token = _refresh_jwt()
-        if new_token:
-            headers["Authorization"] = f"Bearer {new_token}"
-            r = httpx.post(url, headers=headers, json=body, params=upsert_params, timeout=30.0)
+    resolution = "ignore-duplicates" if ignore_duplicates else "merge-duplicates"
+    r = _rest_call("POST", f"/rest/v1/{table}", access_token,
+                   params={"on_conflict": on_conflict}, body=body,
+                   prefer=f"{_WRITE_PREFER},resolution={resolution}")
 
     if r.status_code >= 400:
         raise Exception(f"DB UPSERT {table}: {r.status_code} {r.text}")
-    return r.json()
+    return orjson.loads(r.content)
 
 
 def rpc_request(fn_name, access_token, params):
     """Call a Supabase RPC function.
     Auto-refreshes token on 401 and retries once."""
-    url = f"{SUPABASE_URL}/rest/v1/rpc/{fn_name}"
-    headers = {
-        "apikey": SUPABASE_ANON_KEY,
-        "Authorization": f"Bearer {access_token}",
-        "Content-Type": "application/json",
-    }
-    r = httpx.post(url, headers=headers, json=params, timeout=30.0)
-
-    if r.status_code == 401:
-        new_token = _refresh_jwt()
-        if new_token:
-            headers["Authorization"] = f"Bearer {new_token}"
-            r = httpx.post(url, headers=headers, json=params, timeout=30.0)
+    r = _rest_call("POST", f"/rest/v1/rpc/{fn_name}", access_token, body=params)
 
     if r.status_code >= 400:
         raise Exception(f"RPC {fn_name}: {r.status_code} {r.text}")
-    return r.json()
+    return orjson.loads(r.content)
+
+
+def _run_concurrently(*calls):
+    """Run independent blocking calls, given as (fn, *args), in parallel threads.
+    Returns their results in order. Workers get this script run's context so
+    st.session_state and st.cache_data behave as in the main thread."""
+    ctx = get_script_run_ctx()
+
+    def _call(fn, *args):
+        add_script_run_ctx(threading.current_thread(), ctx)
+        return fn(*args)
+
+    with ThreadPoolExecutor(max_workers=len(calls)) as pool:
+        futures = [pool.submit(_call, *call) for call in calls]
+        return [f.result() for f in futures]
 
 
 # --- Auth functions ---
+# Supabase Auth (GoTrue) is called directly on the shared client; the SDK
+# was only used for these few endpoints.
 
-def sign_up(email, password):
+@dataclass
+class AuthUser:
+    id: str
+    email: str
+
+
+@dataclass
+class AuthSession:
+    access_token: str
+    refresh_token: str
+
+
+@dataclass
+class AuthResponse:
+    user: AuthUser
+    session: AuthSession | None
+
+
+def _auth_call(path, body=None, params=None, access_token=None):
+    """POST to /auth/v1/{path}. Returns the parsed body; raises with
+    GoTrue's error message on failure."""
+    headers = {"Authorization": _bearer(access_token)} if access_token else None
+    r = _http_client().post(f"/auth/v1/{path}", params=params, headers=headers,
+                            content=orjson.dumps(body) if body is not None else None)
     try:
-        response = supabase.auth.sign_up({"email": email, "password": password})
-        if response.user:
-            return response
+        data = orjson.loads(r.content) if r.content else {}
+    except orjson.JSONDecodeError:
+        data = {}
+    if r.status_code >= 400:
+        raise Exception(data.get("msg") or data.get("error_description")
+                        or data.get("message") or f"HTTP {r.status_code}")
+    return data
+
+
+def _auth_response(data):
+    """Token responses nest the user next to the session; signup with email
+    confirmation pending returns the bare user and no session."""
+    user = data.get("user") or data
+    if not user.get("id"):
         return None
+    session = None
+    if data.get("access_token"):
+        session = AuthSession(data["access_token"], data["refresh_token"])
+    return AuthResponse(AuthUser(user["id"], user.get("email")), session)
+
+
+# User-facing messages for known GoTrue errors, checked in order
+_SIGNUP_ERRORS = [
+    (re.compile(r"already registered", re.I),
+     "This email is already registered. Please log in instead."),
+]
+_SIGNIN_ERRORS = [
+    (re.compile(r"invalid|wrong", re.I), "Invalid email or password."),
+    (re.compile(r"not found", re.I), "User not found. Please sign up first."),
+]
+
+
+def _show_auth_error(error_msg, known_errors, fallback):
+    for pattern, message in known_errors:
+        if pattern.search(error_msg):
+            st.error(message)
+            return
+    st.error(f"{fallback}: {error_msg}")
+
+
+def sign_up(email, password):
+    try:
+        return _auth_response(_auth_call("signup", {"email": email, "password": password}))
     except Exception as e:
-        error_msg = str(e)
-        if "already registered" in error_msg.lower():
-            st.error("This email is already registered. Please log in instead.")
-        else:
-            st.error(f"Signup failed: {error_msg}")
+        _show_auth_error(str(e), _SIGNUP_ERRORS, "Signup failed")
         return None
 
 
 def sign_in(email, password):
     try:
-        response = supabase.auth.sign_in_with_password({"email": email, "password": password})
-        return response
+        return _auth_response(_auth_call("token", {"email": email, "password": password},
+                                         params={"grant_type": "password"}))
     except Exception as e:
-        error_msg = str(e)
-        if "invalid" in error_msg.lower() or "wrong" in error_msg.lower():
-            st.error("Invalid email or password.")
-        elif "not found" in error_msg.lower():
-            st.error("User not found. Please sign up first.")
-        else:
-            st.error(f"Login failed: {error_msg}")
+        _show_auth_error(str(e), _SIGNIN_ERRORS, "Login failed")
         return None
 
 
+@st.cache_data(ttl=300, show_spinner=False)
+def _resolve_workspace(user_id, _access_token):
+    """Look up the user's workspace. Cached per user_id — the token is left
+    out of the cache key so a fresh login reuses the lookup.
+    Raises LookupError when the user has none: exceptions are not cached, so
+    a missing workspace is never remembered past its creation."""
+    # Membership + workspace in one request via PostgREST resource embedding
+    rows = db_request("GET", "workspace_members", _access_token,
+        params={"select": "workspaces(id,name)", "user_id": f"eq.{user_id}", "limit": 1})
+
+    ws = rows[0].get("workspaces") if rows else None
+    if not ws:
+        raise LookupError(f"No workspace for user {user_id}")
+    return {"id": ws["id"], "name": ws["name"]}
+
+
 def ensure_workspace(user, access_token):
     """Check if user has a workspace; create one if not."""
     user_id = str(user.id)
     email = user.email
 
     try:
-        rows = db_request("GET", "workspace_members", access_token,
-            params={"select": "workspace_id", "user_id": f"eq.{user_id}"})
-
-        if rows and len(rows) > 0:
-            ws_id = rows[0]["workspace_id"]
-            ws_rows = db_request("GET", "workspaces", access_token,
-                params={"select": "id,name", "id": f"eq.{ws_id}"})
-            if ws_rows:
-                return {"id": ws_rows[0]["id"], "name": ws_rows[0]["name"]}
+        try:
+            return _resolve_workspace(user_id, access_token)
+        except LookupError:
+            pass
 
         ws_name = f"{email}'s Workspace"
         workspace_id = rpc_request("create_workspace_for_user", access_token,
             {"ws_name": ws_name, "ws_user_id": user_id})
+        _resolve_workspace.clear()
 
         return {"id": workspace_id, "name": ws_name}
 
@@ -716,20 +842,34 @@ def ensure_workspace(user, access_token):
 
 
 def logout():
-    supabase.auth.sign_out()
-    for key in ["user", "workspace", "access_token", "refresh_token", "error", "selected_project_id"]:
-        st.session_state[key] = None
+    token = st.session_state.get("access_token")
+    if token:
+        try:
+            _auth_call("logout", access_token=token)
+        except Exception:
+            pass  # Local session is cleared regardless
+    st.session_state.update(dict.fromkeys(_SESSION_DEFAULTS))
     st.rerun()
 
 
 # --- Data functions ---
+# Read helpers are cached across reruns (st.cache_data). Mutations below clear
+# the matching cache. Other tools import this module separately and cannot
+# clear it directly, so they set st.session_state["_projects_stale"] instead.
+
+@st.cache_data(ttl=60, show_spinner=False)
+def _fetch_projects(access_token, workspace_id):
+    return db_request("GET", "projects", access_token,
+        params={"select": "*",
+                 "workspace_id": f"eq.{workspace_id}",
+                 "order": "created_at.asc"})
+
 
 def get_projects(access_token, workspace_id):
+    if st.session_state.pop("_projects_stale", False):
+        _fetch_projects.clear()
     try:
-        return db_request("GET", "projects", access_token,
-            params={"select": "*",
-                     "workspace_id": f"eq.{workspace_id}",
-                     "order": "created_at.asc"})
+        return _fetch_projects(access_token, workspace_id)
     except Exception as e:
         st.session_state.error = str(e)
         return []
@@ -743,18 +883,24 @@ def create_project(access_token, workspace_id, name, domain, country, language):
         if language:
             body["language"] = language
         rows = db_request("POST", "projects", access_token, body=body)
+        _fetch_projects.clear()
         return rows[0] if rows else None
     except Exception as e:
         st.session_state.error = str(e)
         return None
 
 
+@st.cache_data(ttl=60, show_spinner=False)
+def _fetch_queries(access_token, project_id):
+    return db_request("GET", "queries", access_token,
+        params={"select": "id,query_text,category,is_active,created_at",
+                 "project_id": f"eq.{project_id}",
+                 "order": "created_at.asc"})
+
+
 def get_queries(access_token, project_id):
     try:
-        return db_request("GET", "queries", access_token,
-            params={"select": "id,query_text,category,is_active,created_at",
-                     "project_id": f"eq.{project_id}",
-                     "order": "created_at.asc"})
+        return _fetch_queries(access_token, project_id)
     except Exception as e:
         st.session_state.error = str(e)
         return []
@@ -763,53 +909,98 @@ def get_queries(access_token, project_id):
 def add_queries(access_token, project_id, query_list):
     """Insert queries, skipping duplicates. Returns (added_count, skipped_count).
 
-    Uses batch INSERT via PostgREST (single request for all rows) to avoid
-    JWT expiry on large uploads. Falls back to per-row insert if batch fails
-    (e.g. duplicate key on some rows).
+    Single batch INSERT via PostgREST with ON CONFLICT DO NOTHING on
+    (project_id, query_text) — one request regardless of upload size, and rows
+    that already exist are skipped server-side (migration 014).
     """
     # Deduplicate and clean
     clean_rows = []
+    seen = set()
     for q in query_list:
         text = q["query_text"].strip()
         cat = q["category"].strip()
-        if text:
+        if text and text not in seen:
+            seen.add(text)
             clean_rows.append({"project_id": project_id, "query_text": text, "category": cat})
     if not clean_rows:
         return 0, 0
 
-    # Try batch insert first (single request — no JWT expiry risk)
-    try:
-        db_request("POST", "queries", access_token, body=clean_rows)
-        return len(clean_rows), 0
-    except Exception as batch_err:
-        # Batch failed — likely some duplicates. Fall back to per-row.
-        if "duplicate" not in str(batch_err).lower() and "23505" not in str(batch_err):
-            raise
-
-    # Per-row fallback for mixed new/duplicate rows
-    added = 0
-    skipped = 0
-    for row in clean_rows:
-        try:
-            db_request("POST", "queries", access_token,
-                body=row)
-            added += 1
-        except Exception as e:
-            if "duplicate" in str(e).lower() or "23505" in str(e):
-                skipped += 1
-            else:
-                raise
-    return added, skipped
+    inserted = db_upsert("queries", access_token, clean_rows,
+                         on_conflict="project_id,query_text", ignore_duplicates=True)
+    _fetch_queries.clear()
+    added = len(inserted)
+    return added, len(clean_rows) - added
+
 
+CSV_UPLOAD_CHUNK_ROWS = 5000
 
-def delete_query(access_token, query_id):
+
+def _csv_query_columns(uploaded, encoding):
+    """Find the delimiter whose header has query_text + category columns.
+    Returns (delimiter, {stripped_name: raw_name}); delimiter is None if neither fits."""
+    columns = {}
+    for sep in (",", ";"):
+        uploaded.seek(0)
+        header = pd.read_csv(uploaded, sep=sep, nrows=0, encoding=encoding).columns
+        columns = {str(c).strip(): c for c in header}
+        if "query_text" in columns and "category" in columns:
+            return sep, columns
+    return None, columns
+
+
+def _csv_encoding(uploaded):
+    """UTF-8 (BOM stripped — Excel default) if the whole upload decodes as
+    UTF-8, else latin-1. Checked up front so nothing is inserted under the
+    wrong encoding."""
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    uploaded.seek(0)
     try:
-        db_request("DELETE", "queries", access_token,
-            params={"id": f"eq.{query_id}"})
-        return True
-    except Exception as e:
-        st.session_state.error = str(e)
-        return False
+        for block in iter(lambda: uploaded.read(1 << 20), b""):
+            decoder.decode(block)
+        decoder.decode(b"", final=True)
+    except UnicodeDecodeError:
+        return "latin-1"
+    return "utf-8-sig"
+
+
+def _add_queries_from_csv_pass(access_token, project_id, uploaded, encoding):
+    """One streaming pass over the upload. Returns (added_count, row_count)."""
+    sep, columns = _csv_query_columns(uploaded, encoding)
+    if sep is None:
+        raise ValueError(
+            f"CSV must have 'query_text' and 'category' columns. "
+            f"Found columns: {list(columns)}. "
+            f"Tip: In Excel, save as 'CSV UTF-8 (Comma delimited)'."
+        )
+    uploaded.seek(0)
+    chunks = pd.read_csv(
+        uploaded, sep=sep, encoding=encoding, dtype=str, na_filter=False,
+        usecols=[columns["query_text"], columns["category"]],
+        chunksize=CSV_UPLOAD_CHUNK_ROWS,
+    )
+    total_added = total_rows = 0
+    for chunk in chunks:
+        chunk = chunk.rename(columns={columns["query_text"]: "query_text",
+                                      columns["category"]: "category"})
+        chunk = chunk[chunk["query_text"].str.strip().str.len() > 0]
+        if chunk.empty:
+            continue
+        added, _ = add_queries(access_token, project_id, chunk.to_dict("records"))
+        total_added += added
+        total_rows += len(chunk)
+    return total_added, total_rows
+
+
+def add_queries_from_csv(access_token, project_id, uploaded):
+    """Stream an uploaded CSV (query_text, category) into add_queries in chunks.
+    Returns (added_count, skipped_count, row_count). Raises ValueError if the
+    expected columns are missing.
+
+    The encoding (UTF-8, else latin-1) is settled before the first insert.
+    """
+    encoding = _csv_encoding(uploaded)
+    added, rows = _add_queries_from_csv_pass(access_token, project_id, uploaded, encoding)
+    return added, rows - added, rows
 
 
 def delete_queries_bulk(access_token, query_ids):
@@ -820,6 +1011,7 @@ def delete_queries_bulk(access_token, query_ids):
     try:
         db_request("DELETE", "queries", access_token,
             params={"id": f"in.({ids_csv})"})
+        _fetch_queries.clear()
         return len(query_ids)
     except Exception as e:
         st.session_state.error = str(e)
@@ -828,110 +1020,195 @@ def delete_queries_bulk(access_token, query_ids):
 
 # --- Citation engine ---
 
-def check_citation(query_text, domain, api_key):
-    """Check if domain appears in Perplexity's sources for a query."""
-    response = httpx.post(
+# Concurrent Perplexity requests per check run, and minimum spacing between
+# request starts (the old sequential loop slept 0.2s between calls).
+PERPLEXITY_CONCURRENCY = 5
+PERPLEXITY_MIN_INTERVAL = 0.2
+
+
+class _RequestSpacer:
+    """Async rate limiter — lets one request start every `interval` seconds."""
+
+    def __init__(self, interval):
+        self.interval = interval
+        self._lock = asyncio.Lock()
+        self._next_start = 0.0
+
+    async def wait(self):
+        async with self._lock:
+            loop = asyncio.get_running_loop()
+            now = loop.time()
+            if self._next_start > now:
+                await asyncio.sleep(self._next_start - now)
+                now = self._next_start
+            self._next_start = now + self.interval
+
+
+@st.cache_resource
+def _perplexity_citation_cache():
+    """Process-wide {(query_text, model, check_date): citations}.
+    The Perplexity answer does not depend on the project domain, so projects
+    tracking the same query share one paid call per day."""
+    return {}
+
+
+async def _fetch_perplexity(session, query_text, api_key, model="sonar", force=False):
+    """Return Perplexity's citation list for a query, cached for the day.
+    force=True always asks Perplexity and overwrites today's cached answer."""
+    today = str(date.today())
+    key = (query_text, model, today)
+    cache = _perplexity_citation_cache()
+    if not force and key in cache:
+        return cache[key]
+
+    async with session.post(
         "https://api.perplexity.ai/chat/completions",
         headers={
             "Authorization": f"Bearer {api_key}",
             "Content-Type": "application/json",
         },
-        json={
-            "model": "sonar",
+        data=orjson.dumps({
+            "model": model,
             "messages": [{"role": "user", "content": query_text}],
-        },
-        timeout=30.0,
-    )
-    response.raise_for_status()
-    data = response.json()
+        }),
+        timeout=aiohttp.ClientTimeout(total=30),
+    ) as response:
+        response.raise_for_status()
+        data = orjson.loads(await response.read())
 
     # Citations may be under "citations" or "sources"
     citations = data.get("citations", data.get("sources", []))
     if not isinstance(citations, list):
         citations = []
 
-    appears = False
-    position = None
-    citation_url = None
+    # Drop earlier days before adding today's entry
+    for stale_key in [k for k in list(cache) if k[2] != today]:
+        cache.pop(stale_key, None)
+    cache[key] = citations
+    return citations
+
 
+def _match_domain(citations, domain):
+    """Find the first citation containing domain."""
+    domain_lc = domain.lower()
     for i, url in enumerate(citations):
-        if domain.lower() in url.lower():
-            appears = True
-            position = i + 1
-            citation_url = url
-            break
-
-    return {
-        "appears": appears,
-        "position": position,
-        "citation_url": citation_url,
-        "raw_sources": citations,
-    }
-
-
-def run_full_citation_check(project_id, domain, queries, api_key):
-    """Run citation checks on ALL queries, batched by category with JWT refresh.
+        if isinstance(url, str) and domain_lc in url.lower():
+            return {"appears": True, "position": i + 1, "citation_url": url}
+    return {"appears": False, "position": None, "citation_url": None}
+
+
+async def check_citation(session, query_text, domain, api_key, force=False):
+    """Check if domain appears in Perplexity's sources for a query."""
+    citations = await _fetch_perplexity(session, query_text, api_key, force=force)
+    return {**_match_domain(citations, domain), "raw_sources": citations}
+
+
+async def _check_citations_concurrently(queries, domain, api_key, on_done, force=False):
+    """Run check_citation for every query with bounded concurrency.
+    Calls on_done(query, result_or_exception) as each request finishes.
+
+    The aiohttp session lives for one event loop (one asyncio.run), so it is
+    created per batch rather than cached across Streamlit reruns."""
+    sem = asyncio.Semaphore(PERPLEXITY_CONCURRENCY)
+    spacer = _RequestSpacer(PERPLEXITY_MIN_INTERVAL)
+    connector = aiohttp.TCPConnector(limit=PERPLEXITY_CONCURRENCY, ttl_dns_cache=300)
+
+    async with aiohttp.ClientSession(connector=connector) as session:
+        async def bounded(q):
+            async with sem:
+                await spacer.wait()
+                try:
+                    return q, await check_citation(session, q["query_text"], domain, api_key,
+                                                   force=force)
+                except Exception as e:
+                    return q, e
+
+        for next_done in asyncio.as_completed([bounded(q) for q in queries]):
+            q, outcome = await next_done
+            on_done(q, outcome)
+
+
+def _checked_today_query_ids(access_token, project_id, today):
+    """IDs of queries that already have a Perplexity result for today."""
+    rows = db_request("GET", "geo_check_results", access_token,
+        params={
+            "select": "query_id",
+            "project_id": f"eq.{project_id}",
+            "engine": "eq.perplexity",
+            "check_date": f"eq.{today}",
+        })
+    return {r["query_id"] for r in rows}
+
+
+def run_full_citation_check(project_id, domain, queries, api_key, force=False):
+    """Run citation checks on ALL queries concurrently against Perplexity.
+    Queries already checked today are skipped unless force=True.
     Accumulates results in memory, bulk-writes only on completion.
     Returns True if check completed (even with some failures)."""
-    # Group by category for internal batching
-    categories = {}
-    for q in queries:
-        cat = q.get("category", "Uncategorised")
-        categories.setdefault(cat, []).append(q)
-    cat_names = sorted(categories.keys())
-
-    total_queries = len(queries)
     today = str(date.today())
+    already_checked = 0
+    if not force:
+        try:
+            done_ids = _checked_today_query_ids(
+                st.session_state.get("access_token"), project_id, today)
+        except Exception:
+            done_ids = set()  # Can't tell — check everything
+        already_checked = sum(1 for q in queries if q["id"] in done_ids)
+        queries = [q for q in queries if q["id"] not in done_ids]
+        if not queries:
+            # The caller reruns straight away; show this on the next run
+            st.session_state["_citation_check_notice"] = (
+                "All keywords have already been checked today. Tick "
+                "'Re-check keywords already checked today' to run them again.")
+            return True
+
+    n_categories = len({q.get("category", "Uncategorised") for q in queries})
+    total_queries = len(queries)
     accumulated_results = []  # Build up in memory, write at end
+    total_done = 0
     total_checked = 0
     total_failures = 0
     last_error = ""
 
     progress_bar = st.progress(0)
     status_text = st.empty()
-    global_idx = 0
-
-    for cat_idx, cat_name in enumerate(cat_names):
-        cat_queries = categories[cat_name]
 
-        # Refresh JWT between category batches
-        if cat_idx > 0:
-            _refresh_jwt()
-            time.sleep(1)
+    status_text.text(f"Checking citations: 0/{total_queries}")
 
-        for i, q in enumerate(cat_queries):
-            global_idx += 1
-            status_text.text(
-                f"Checking citations: {global_idx}/{total_queries} "
-                f"(Category: {cat_name})"
-            )
-            progress_bar.progress(global_idx / total_queries)
-
-            try:
-                result = check_citation(q["query_text"], domain, api_key)
-                accumulated_results.append({
-                    "query_id": q["id"],
-                    "project_id": project_id,
-                    "check_date": today,
-                    "appears": result["appears"],
-                    "position": result["position"],
-                    "citation_url": result["citation_url"],
-                    "engine": "perplexity",
-                    "raw_sources": json.dumps(result["raw_sources"]),
-                })
-                total_checked += 1
-            except Exception as e:
-                total_failures += 1
-                last_error = str(e)
+    def _on_done(q, outcome):
+        nonlocal total_done, total_checked, total_failures, last_error
+        total_done += 1
+        if isinstance(outcome, Exception):
+            total_failures += 1
+            last_error = str(outcome)
+        else:
+            accumulated_results.append({
+                "query_id": q["id"],
+                "project_id": project_id,
+                "check_date": today,
+                "appears": outcome["appears"],
+                "position": outcome["position"],
+                "citation_url": outcome["citation_url"],
+                "engine": "perplexity",
+                # Stored as a JSON string: the shared table's existing format
+                "raw_sources": orjson.dumps(outcome["raw_sources"]).decode(),
+            })
+            total_checked += 1
+        status_text.text(f"Checking citations: {total_done}/{total_queries}")
+        progress_bar.progress(total_done / total_queries)
 
-            if global_idx < total_queries:
-                time.sleep(0.2)
+    # One bounded run over every query — Perplexity calls don't use the
+    # Supabase JWT, so nothing needs refreshing until the write phase.
+    asyncio.run(_check_citations_concurrently(queries, domain, api_key, _on_done,
+                                              force=force))
 
     progress_bar.empty()
     status_text.empty()
 
     # Bulk-write ALL results only after full run completes
     if accumulated_results:
+        # The run may have outlasted the 1-hour JWT
+        refresh_jwt()
         write_status = st.empty()
         write_status.info(f"Saving {len(accumulated_results)} results...")
         write_failures = 0
@@ -942,7 +1219,7 @@ def run_full_citation_check(project_id, domain, queries, api_key):
                           on_conflict="query_id,engine,check_date")
             except Exception:
                 # Refresh and retry once
-                _refresh_jwt()
+                refresh_jwt()
                 token = st.session_state.get("access_token")
                 try:
                     db_upsert("geo_check_results", token, row,
@@ -950,6 +1227,8 @@ def run_full_citation_check(project_id, domain, queries, api_key):
                 except Exception:
                     write_failures += 1
         write_status.empty()
+        _fetch_results.clear()
+        _fetch_check_history.clear()
         if write_failures:
             st.warning(f"{write_failures} results failed to save.")
 
@@ -959,13 +1238,15 @@ def run_full_citation_check(project_id, domain, queries, api_key):
         log_usage_event(
             event_type="citation_check",
             api_provider="perplexity",
-            event_detail=f"{total_checked}/{total_queries} checked, {len(cat_names)} categories",
+            event_detail=f"{total_checked}/{total_queries} checked, {n_categories} categories",
             project_id=project_id,
         )
     except Exception:
         pass
 
     msg = f"Done! {total_checked}/{total_queries} keywords checked."
+    if already_checked:
+        msg += f" {already_checked} already checked today were skipped."
     if total_failures:
         msg += f" {total_failures} failed."
         st.warning(msg)
@@ -976,15 +1257,80 @@ def run_full_citation_check(project_id, domain, queries, api_key):
     return True
 
 
+def _latest_check_date(access_token, project_id):
+    """Most recent check_date for a project (single-row query), or None."""
+    rows = db_request("GET", "geo_check_results", access_token,
+        params={
+            "select": "check_date",
+            "project_id": f"eq.{project_id}",
+            "order": "check_date.desc",
+            "limit": 1,
+        })
+    return rows[0]["check_date"] if rows else None
+
+
+@st.cache_data(ttl=600, show_spinner=False)
+def _fetch_results(access_token, project_id, latest_check_date):
+    # Only the latest check day is transferred; a new check day also changes
+    # the cache key, so cached rows are never older than the data.
+    return db_request("GET", "geo_check_results", access_token,
+        params={
+            "select": "query_id,check_date,appears,position,citation_url,raw_sources",
+            "project_id": f"eq.{project_id}",
+            "check_date": f"eq.{latest_check_date}",
+            "order": "created_at.desc",
+        })
+
+
+def _count_check_history(access_token, project_id):
+    """Client-side per-day counts from slim (check_date, appears) rows.
+    Fallback for databases without the geo_check_daily_counts RPC."""
+    rows = db_request("GET", "geo_check_results", access_token,
+        params={
+            "select": "check_date,appears",
+            "project_id": f"eq.{project_id}",
+            "order": "check_date.asc",
+        })
+    day_counts = {}
+    for r in rows:
+        counts = day_counts.setdefault(r["check_date"], {"check_date": r["check_date"],
+                                                         "total": 0, "cited": 0})
+        counts["total"] += 1
+        if r["appears"]:
+            counts["cited"] += 1
+    return list(day_counts.values())
+
+
+@st.cache_data(ttl=600, show_spinner=False)
+def _fetch_check_history(access_token, project_id, latest_check_date):
+    # latest_check_date is not used by the query; it is only part of the cache
+    # key, so a new check day busts the cached history.
+    r = _rest_call("POST", "/rest/v1/rpc/geo_check_daily_counts", access_token,
+                   body={"p_project_id": project_id})
+    if r.status_code == 404:
+        # Migration 016 not run yet
+        return _count_check_history(access_token, project_id)
+    if r.status_code >= 400:
+        raise Exception(f"RPC geo_check_daily_counts: {r.status_code} {r.text}")
+    return orjson.loads(r.content)
+
+
 def get_latest_results(access_token, project_id):
     """Get the most recent citation check results for a project."""
     try:
-        return db_request("GET", "geo_check_results", access_token,
-            params={
-                "select": "query_id,check_date,appears,position,citation_url,raw_sources",
-                "project_id": f"eq.{project_id}",
-                "order": "check_date.desc,created_at.desc",
-            })
+        latest_check_date = _latest_check_date(access_token, project_id)
+        if latest_check_date is None:
+            return []
+        return _fetch_results(access_token, project_id, latest_check_date)
+    except Exception as e:
+        st.session_state.error = str(e)
+        return []
+
+
+def get_check_history(access_token, project_id, latest_check_date):
+    """One (check_date, total, cited) row per check day, for the trend chart."""
+    try:
+        return _fetch_check_history(access_token, project_id, latest_check_date)
     except Exception as e:
         st.session_state.error = str(e)
         return []
@@ -992,6 +1338,14 @@ def get_latest_results(access_token, project_id):
 
 # --- UI: Auth page ---
 
+def _track_login():
+    try:
+        from tracking.usage_tracker import log_usage_event
+        log_usage_event(event_type="login")
+    except Exception:
+        pass
+
+
 def show_auth_page():
     st.title("Aevilab")
     st.markdown("AI-powered search optimisation tools")
@@ -1021,17 +1375,14 @@ def show_auth_page():
                         st.session_state.user = response.user
                         st.session_state.access_token = token
                         st.session_state.refresh_token = response.session.refresh_token
-                        workspace = ensure_workspace(response.user, token)
+                        # Workspace lookup and login tracking are independent requests
+                        workspace, _ = _run_concurrently(
+                            (ensure_workspace, response.user, token),
+                            (_track_login,),
+                        )
                         if workspace:
                             st.session_state.workspace = workspace
 
-                        # Track login
-                        try:
-                            from tracking.usage_tracker import log_usage_event
-                            log_usage_event(event_type="login")
-                        except Exception:
-                            pass
-
                         st.rerun()
 
     with tab_signup:
@@ -1061,6 +1412,156 @@ def show_auth_page():
                             st.success("Account created! Check your email to confirm, then log in.")
 
 
+# --- UI: Rank Tracker query management ---
+
+@st.fragment
+def _manage_queries_fragment(token, project, queries):
+    """Add/select/delete queries. Runs as a fragment: selection edits and
+    confirm toggles rerun only this block; data changes rerun the whole app
+    so metrics and caches refresh."""
+    with st.expander("Manage Queries"):
+        st.subheader("Add Queries")
+        tab_single, tab_bulk, tab_csv = st.tabs(["Single", "Bulk Text", "CSV Upload"])
+
+        with tab_single:
+            with st.form("add_single_query"):
+                q_text = st.text_input("Query", key="single_query_text")
+                q_cat = st.text_input("Category", key="single_query_category")
+                if st.form_submit_button("Add"):
+                    if not q_text or not q_cat:
+                        st.error("Query and category are required.")
+                    else:
+                        added, skipped = add_queries(token, project["id"],
+                            [{"query_text": q_text, "category": q_cat}])
+                        if added:
+                            st.success(f"Added 1 query.")
+                            st.rerun()
+                        elif skipped:
+                            st.warning("Query already exists — skipped.")
+
+        with tab_bulk:
+            with st.form("add_bulk_queries"):
+                bulk_text = st.text_area("Queries (one per line)", key="bulk_query_text",
+                    height=150)
+                bulk_cat = st.text_input("Category for all", key="bulk_query_category")
+                if st.form_submit_button("Add All"):
+                    if not bulk_text or not bulk_cat:
+                        st.error("Queries and category are required.")
+                    else:
+                        lines = [l.strip() for l in bulk_text.strip().split("\n") if l.strip()]
+                        query_list = [{"query_text": l, "category": bulk_cat} for l in lines]
+                        added, skipped = add_queries(token, project["id"], query_list)
+                        msg = f"Added {added} queries."
+                        if skipped:
+                            msg += f" {skipped} duplicates skipped."
+                        st.success(msg)
+                        st.rerun()
+
+        with tab_csv:
+            uploaded = st.file_uploader("Upload CSV (columns: query_text, category)",
+                type=["csv"], key="csv_upload")
+            if uploaded:
+                try:
+                    with st.spinner("Uploading queries..."):
+                        added, skipped, n_rows = add_queries_from_csv(
+                            token, project["id"], uploaded)
+                    if n_rows:
+                        msg = f"Added {added} queries."
+                        if skipped:
+                            msg += f" {skipped} duplicates skipped."
+                        st.success(msg)
+                        st.rerun()
+                    else:
+                        st.warning("CSV had no valid rows.")
+                except ValueError as e:
+                    st.error(str(e))
+                except Exception as e:
+                    st.error(f"CSV upload failed: {e}")
+
+        st.caption("💡 Write queries as natural language — the way someone would type them into ChatGPT or Perplexity. For example: \"who are the leading CDP experts in the UK\" rather than \"CDP expert + UK\". Personal name queries like \"who is Pal Erik Waagbo\" work as-is. Queries are sent to the AI engine exactly as written — no preprocessing is applied.")
+
+        # Query list — one data editor with a selection column, and bulk delete
+        if queries:
+            st.divider()
+            st.subheader("Queries")
+
+            # Category filter
+            all_categories = sorted({q["category"] for q in queries})
+            cat_options = ["All categories"] + all_categories
+            selected_cat = st.selectbox("Filter by category", cat_options, key="query_cat_filter")
+
+            visible_queries = queries if selected_cat == "All categories" else [
+                q for q in queries if q["category"] == selected_cat
+            ]
+
+            # Select all / Deselect all re-create the editor (new key) with the
+            # selection column preset, since its cell edits can't be set directly.
+            # The preset remembers the filter it was made under and is dropped
+            # once the filter changes, so it never ticks rows the user didn't see.
+            editor_rev = st.session_state.get("_query_editor_rev", 0)
+            if st.session_state.get("_query_select_all") not in (None, selected_cat):
+                st.session_state.pop("_query_select_all")
+            preselect = st.session_state.get("_query_select_all") == selected_cat
+            editor_df = pd.DataFrame(visible_queries, columns=["id", "query_text", "category"])
+            editor_df.insert(0, "selected", preselect)
+            edited = st.data_editor(
+                editor_df,
+                key=f"query_editor_{project['id']}_{selected_cat}_{editor_rev}",
+                disabled=["id", "query_text", "category"],
+                column_order=["selected", "query_text", "category"],
+                column_config={
+                    "selected": st.column_config.CheckboxColumn("", default=False),
+                    "query_text": "Query",
+                    "category": "Category",
+                },
+                hide_index=True,
+                use_container_width=True,
+            )
+            selected_ids = edited.loc[edited["selected"], "id"].tolist()
+            n_selected = len(selected_ids)
+            all_selected = n_selected == len(visible_queries) and n_selected > 0
+
+            def _reset_query_editor(select_all):
+                st.session_state["_query_select_all"] = selected_cat if select_all else None
+                st.session_state["_query_editor_rev"] = editor_rev + 1
+
+            col_sel, col_count = st.columns([1, 3])
+            with col_sel:
+                if all_selected:
+                    if st.button("Deselect all", key="btn_deselect_all"):
+                        _reset_query_editor(False)
+                        st.rerun(scope="fragment")
+                else:
+                    if st.button("Select all", key="btn_select_all"):
+                        _reset_query_editor(True)
+                        st.rerun(scope="fragment")
+            with col_count:
+                if n_selected > 0:
+                    st.caption(f"{n_selected} selected")
+
+            # Bulk delete button + confirmation
+            if n_selected > 0:
+                if st.session_state.get("_confirm_bulk_delete"):
+                    st.warning(f"Delete {n_selected} keywords? This cannot be undone.")
+                    col_yes, col_no = st.columns(2)
+                    with col_yes:
+                        if st.button("Yes, delete", key="btn_confirm_delete", type="primary"):
+                            deleted = delete_queries_bulk(token, selected_ids)
+                            st.session_state["_confirm_bulk_delete"] = False
+                            _reset_query_editor(False)
+                            if deleted:
+                                st.success(f"Deleted {deleted} keywords.")
+                            st.rerun()
+                    with col_no:
+                        if st.button("Cancel", key="btn_cancel_delete"):
+                            st.session_state["_confirm_bulk_delete"] = False
+                            st.rerun(scope="fragment")
+                else:
+                    if st.button(f"Delete selected ({n_selected})", key="btn_bulk_delete"):
+                        st.session_state["_confirm_bulk_delete"] = True
+                        st.rerun(scope="fragment")
+
+
 # --- UI: Dashboard ---
 
 def show_dashboard():
@@ -1070,6 +1571,7 @@ def show_dashboard():
 
     # Load projects
     projects = get_projects(token, workspace["id"])
+    projects_by_id = {p["id"]: p for p in projects}
 
     # --- Sidebar ---
     with st.sidebar:
@@ -1097,17 +1599,13 @@ def show_dashboard():
         st.divider()
 
         if projects:
-            project_names = [p["name"] for p in projects]
-            current_idx = 0
-            if st.session_state.selected_project_id:
-                for i, p in enumerate(projects):
-                    if p["id"] == st.session_state.selected_project_id:
-                        current_idx = i
-                        break
-            selected_name = st.selectbox("Project", project_names, index=current_idx,
-                                         disabled=_op_locked)
-            selected_project = next(p for p in projects if p["name"] == selected_name)
-            new_project_id = selected_project["id"]
+            project_ids = list(projects_by_id)
+            current_id = st.session_state.selected_project_id
+            current_idx = project_ids.index(current_id) if current_id in projects_by_id else 0
+            new_project_id = st.selectbox("Project", project_ids, index=current_idx,
+                                          format_func=lambda pid: projects_by_id[pid]["name"],
+                                          disabled=_op_locked)
+            selected_project = projects_by_id[new_project_id]
 
             # --- Central project change detector (#35) ---
             prev_project_id = st.session_state.get("_prev_project_id")
@@ -1116,7 +1614,7 @@ def show_dashboard():
                 _project_scoped_keys = [
                     "domain_context",
                     # Rank Tracker
-                    "selected_query_ids", "_confirm_bulk_delete",
+                    "_query_select_all", "_query_editor_rev", "_confirm_bulk_delete",
                     # Crawler
                     "crawl_results", "url_list_results", "sitemap_results",
                     # Cross-tool handoff
@@ -1124,12 +1622,12 @@ def show_dashboard():
                 ]
                 for k in _project_scoped_keys:
                     st.session_state.pop(k, None)
-                # Clear prefixed keys (AEO, crawler, checkbox widgets, strategy cache)
+                # Clear prefixed keys (AEO, crawler, query editor widgets, strategy cache)
                 for k in list(st.session_state.keys()):
                     if (k.startswith("aeo_page_") or k.startswith("aeo_arbeidspakke")
                             or k.startswith("aeo_intent_") or k.startswith("aeo_custom_")
                             or k.startswith("_domain_strategy_") or k.startswith("_overview_data_")
-                            or k.startswith("_google_connected_") or k.startswith("cb_")):
+                            or k.startswith("_google_connected_") or k.startswith("query_editor_")):
                         del st.session_state[k]
             st.session_state["_prev_project_id"] = new_project_id
 
@@ -1173,7 +1671,7 @@ def show_dashboard():
     # --- Route to selected tool ---
     def _build_project_ctx():
         if st.session_state.selected_project_id and projects:
-            p = next((p for p in projects if p["id"] == st.session_state.selected_project_id), None)
+            p = projects_by_id.get(st.session_state.selected_project_id)
             if p:
                 return {
                     "id": p["id"], "name": p["name"], "domain": p.get("domain", ""),
@@ -1242,6 +1740,7 @@ def show_dashboard():
                     db_request("PATCH", "projects", token,
                                params={"id": f"eq.{_s_pid}"},
                                body={"domain_context": _new_dc if _new_dc else None})
+                    _fetch_projects.clear()
                     st.session_state["domain_context"] = _new_dc
                     st.session_state.pop(f"_overview_data_{_s_pid}", None)
                     st.success("Domain context saved.")
@@ -1267,7 +1766,7 @@ def show_dashboard():
     if not st.session_state.selected_project_id:
         st.session_state.selected_project_id = projects[0]["id"]
 
-    project = next((p for p in projects if p["id"] == st.session_state.selected_project_id), projects[0])
+    project = projects_by_id.get(st.session_state.selected_project_id, projects[0])
 
     # Project header
     st.title(project["name"])
@@ -1275,25 +1774,29 @@ def show_dashboard():
         + (f" · Country: {project['country']}" if project.get("country") else "")
         + (f" · Language: {project['language']}" if project.get("language") else ""))
 
-    # Load queries
-    queries = get_queries(token, project["id"])
+    # Load queries and latest results in parallel (cache hits return at once)
+    queries, results = _run_concurrently(
+        (get_queries, token, project["id"]),
+        (get_latest_results, token, project["id"]),
+    )
+
+    active_queries = [q for q in queries if q.get("is_active", True)]
 
     # Query summary
     if queries:
-        categories = set(q["category"] for q in queries)
-        st.markdown(f"**{len(queries)} queries** across **{len(categories)} categories**")
+        n_categories = len({q["category"] for q in queries})
+        st.markdown(f"**{len(queries)} queries** across **{n_categories} categories**")
     else:
         st.info("Add queries to start monitoring AI search citations.")
 
     # --- Citation check ---
     if queries:
         st.divider()
-        active_queries = [q for q in queries if q.get("is_active", True)]
 
         if not PERPLEXITY_API_KEY:
             st.warning("Set PERPLEXITY_API_KEY to run checks.")
         else:
-            n_cats = len(set(q.get("category", "Uncategorised") for q in active_queries))
+            n_cats = len({q.get("category", "Uncategorised") for q in active_queries})
             col_btn, col_info = st.columns([1, 3])
             with col_btn:
                 run_check = st.button(
@@ -1303,26 +1806,30 @@ def show_dashboard():
                 )
             with col_info:
                 st.caption(f"{len(active_queries)} keywords across {n_cats} categories")
+                force_recheck = st.checkbox(
+                    "Re-check keywords already checked today", key="force_recheck",
+                    disabled=st.session_state.get("operation_in_progress", False),
+                )
+
+            notice = st.session_state.pop("_citation_check_notice", None)
+            if notice:
+                st.info(notice)
 
             if run_check:
                 st.session_state["operation_in_progress"] = True
                 try:
                     run_full_citation_check(
-                        project["id"], project["domain"], active_queries, PERPLEXITY_API_KEY
+                        project["id"], project["domain"], active_queries, PERPLEXITY_API_KEY,
+                        force=force_recheck,
                     )
                 finally:
                     st.session_state["operation_in_progress"] = False
                 st.rerun()
 
     # --- Dashboard ---
-    results = get_latest_results(token, project["id"])
-    q_lookup = {q["id"]: q for q in queries}
-
     if results:
-        # Split results by check date
         latest_date = results[0]["check_date"]
-        latest_results = [r for r in results if r["check_date"] == latest_date]
-        all_dates = sorted(set(r["check_date"] for r in results))
+        latest_results = results
 
         cited = sum(1 for r in latest_results if r["appears"])
         total = len(latest_results)
@@ -1339,8 +1846,14 @@ def show_dashboard():
         # Trend chart — only plot dates with complete checks
         # A "complete" check date has results for at least 80% of current active queries
         # (allows for small query list changes over time without dropping data points)
-        active_query_count = len([q for q in queries if q.get("is_active", True)])
-        completeness_threshold = max(1, int(active_query_count * 0.8))
+        completeness_threshold = max(1, int(len(active_queries) * 0.8))
+
+        # Per-date (total, cited) counts, aggregated server-side
+        day_counts = {
+            r["check_date"]: (r["total"], r["cited"])
+            for r in get_check_history(token, project["id"], latest_date)
+        }
+        all_dates = sorted(day_counts)
 
         if len(all_dates) > 1:
             st.divider()
@@ -1348,12 +1861,10 @@ def show_dashboard():
             trend_data = {}
             skipped_dates = 0
             for d in all_dates:
-                day_results = [r for r in results if r["check_date"] == d]
-                if len(day_results) < completeness_threshold:
+                day_total, day_cited = day_counts[d]
+                if day_total < completeness_threshold:
                     skipped_dates += 1
                     continue
-                day_cited = sum(1 for r in day_results if r["appears"])
-                day_total = len(day_results)
                 trend_data[d] = (day_cited / day_total * 100) if day_total > 0 else 0
             if trend_data and len(trend_data) > 1:
                 st.line_chart({"Citation Rate %": trend_data})
@@ -1366,34 +1877,34 @@ def show_dashboard():
         elif len(all_dates) == 1:
             st.caption("Run citation checks on different days to see trends.")
 
+        # Latest results joined to their queries (one vectorised merge)
+        q_df = pd.DataFrame(queries, columns=["id", "query_text", "category"])
+        latest_df = pd.DataFrame(latest_results).merge(
+            q_df, left_on="query_id", right_on="id", how="left")
+        latest_df[["query_text", "category"]] = (
+            latest_df[["query_text", "category"]].fillna("Unknown"))
+        latest_df["appears"] = latest_df["appears"].fillna(False).astype(bool)
+
         # Category breakdown
         st.divider()
         st.subheader("Category Breakdown")
-        cat_stats = {}
-        for r in latest_results:
-            q_info = q_lookup.get(r["query_id"])
-            cat = q_info["category"] if q_info else "Unknown"
-            if cat not in cat_stats:
-                cat_stats[cat] = {"queries": 0, "cited": 0, "positions": []}
-            cat_stats[cat]["queries"] += 1
-            if r["appears"]:
-                cat_stats[cat]["cited"] += 1
-                if r["position"]:
-                    cat_stats[cat]["positions"].append(r["position"])
-
-        cat_table = []
-        for cat, s in cat_stats.items():
-            cat_rate = (s["cited"] / s["queries"] * 100) if s["queries"] > 0 else 0
-            cat_avg = sum(s["positions"]) / len(s["positions"]) if s["positions"] else None
-            cat_table.append({
-                "Category": cat,
-                "Queries": s["queries"],
-                "Cited": s["cited"],
-                "Rate": f"{cat_rate:.0f}%",
-                "Avg Position": f"{cat_avg:.1f}" if cat_avg else "—",
-            })
-        cat_table.sort(key=lambda x: float(x["Rate"].rstrip("%")), reverse=True)
-        st.dataframe(cat_table, use_container_width=True, hide_index=True)
+        position = pd.to_numeric(latest_df["position"], errors="coerce")
+        cat_df = (
+            latest_df.assign(cited_position=position.where(latest_df["appears"] & (position > 0)))
+            .groupby("category", sort=False)
+            .agg(Queries=("query_id", "size"), Cited=("appears", "sum"),
+                 avg_position=("cited_position", "mean"))
+            .reset_index()
+        )
+        cat_df["rate"] = cat_df["Cited"] / cat_df["Queries"] * 100
+        cat_df = cat_df.sort_values("rate", ascending=False, kind="stable")
+        cat_df["Rate"] = cat_df["rate"].map(lambda v: f"{v:.0f}%")
+        cat_df["Avg Position"] = cat_df["avg_position"].map(
+            lambda v: f"{v:.1f}" if pd.notna(v) else "—")
+        st.dataframe(
+            cat_df.rename(columns={"category": "Category"})[
+                ["Category", "Queries", "Cited", "Rate", "Avg Position"]],
+            use_container_width=True, hide_index=True)
 
         # Authority set analysis
         st.divider()
@@ -1403,8 +1914,8 @@ def show_dashboard():
             sources = r.get("raw_sources")
             if isinstance(sources, str):
                 try:
-                    sources = json.loads(sources)
-                except (json.JSONDecodeError, TypeError):
+                    sources = orjson.loads(sources)
+                except orjson.JSONDecodeError:
                     sources = []
             if isinstance(sources, list):
                 for url in sources:
@@ -1429,191 +1940,21 @@ def show_dashboard():
             st.info("No source data available.")
 
         # Uncited queries
-        uncited = [r for r in latest_results if not r["appears"]]
-        if uncited:
+        uncited_df = latest_df.loc[~latest_df["appears"], ["query_text", "category"]]
+        if not uncited_df.empty:
             st.divider()
-            st.subheader(f"Uncited Queries ({len(uncited)})")
-            uncited_table = []
-            for r in uncited:
-                q_info = q_lookup.get(r["query_id"])
-                uncited_table.append({
-                    "Query": q_info["query_text"] if q_info else "Unknown",
-                    "Category": q_info["category"] if q_info else "Unknown",
-                })
-            uncited_table.sort(key=lambda x: x["Category"])
-            st.dataframe(uncited_table, use_container_width=True, hide_index=True)
+            st.subheader(f"Uncited Queries ({len(uncited_df)})")
+            st.dataframe(
+                uncited_df.rename(columns={"query_text": "Query", "category": "Category"})
+                .sort_values("Category", kind="stable"),
+                use_container_width=True, hide_index=True)
 
     else:
         st.info("No citation data yet. Click 'Run Citation Check' to start.")
 
     # --- Manage Queries (in expander) ---
     st.divider()
-    with st.expander("Manage Queries"):
-        st.subheader("Add Queries")
-        tab_single, tab_bulk, tab_csv = st.tabs(["Single", "Bulk Text", "CSV Upload"])
-
-        with tab_single:
-            with st.form("add_single_query"):
-                q_text = st.text_input("Query", key="single_query_text")
-                q_cat = st.text_input("Category", key="single_query_category")
-                if st.form_submit_button("Add"):
-                    if not q_text or not q_cat:
-                        st.error("Query and category are required.")
-                    else:
-                        added, skipped = add_queries(token, project["id"],
-                            [{"query_text": q_text, "category": q_cat}])
-                        if added:
-                            st.success(f"Added 1 query.")
-                            st.rerun()
-                        elif skipped:
-                            st.warning("Query already exists — skipped.")
-
-        with tab_bulk:
-            with st.form("add_bulk_queries"):
-                bulk_text = st.text_area("Queries (one per line)", key="bulk_query_text",
-                    height=150)
-                bulk_cat = st.text_input("Category for all", key="bulk_query_category")
-                if st.form_submit_button("Add All"):
-                    if not bulk_text or not bulk_cat:
-                        st.error("Queries and category are required.")
-                    else:
-                        lines = [l.strip() for l in bulk_text.strip().split("\n") if l.strip()]
-                        query_list = [{"query_text": l, "category": bulk_cat} for l in lines]
-                        added, skipped = add_queries(token, project["id"], query_list)
-                        msg = f"Added {added} queries."
-                        if skipped:
-                            msg += f" {skipped} duplicates skipped."
-                        st.success(msg)
-                        st.rerun()
-
-        with tab_csv:
-            uploaded = st.file_uploader("Upload CSV (columns: query_text, category)",
-                type=["csv"], key="csv_upload")
-            if uploaded:
-                try:
-                    raw_bytes = uploaded.getvalue()
-                    # Decode: utf-8-sig strips BOM if present (Excel default), fallback chain
-                    try:
-                        text = raw_bytes.decode("utf-8-sig")
-                    except UnicodeDecodeError:
-                        try:
-                            text = raw_bytes.decode("utf-8")
-                        except UnicodeDecodeError:
-                            text = raw_bytes.decode("latin-1")
-
-                    reader = csv.DictReader(io.StringIO(text))
-                    fieldnames = [f.strip() for f in (reader.fieldnames or [])]
-
-                    # Try semicolon delimiter if comma didn't produce expected columns
-                    if "query_text" not in fieldnames or "category" not in fieldnames:
-                        reader = csv.DictReader(io.StringIO(text), delimiter=";")
-                        fieldnames = [f.strip() for f in (reader.fieldnames or [])]
-
-                    if "query_text" not in fieldnames or "category" not in fieldnames:
-                        st.error(
-                            f"CSV must have 'query_text' and 'category' columns. "
-                            f"Found columns: {fieldnames}. "
-                            f"Tip: In Excel, save as 'CSV UTF-8 (Comma delimited)'."
-                        )
-                    else:
-                        rows = [{"query_text": r.get("query_text", "").strip(),
-                                 "category": r.get("category", "").strip()}
-                                for r in reader if r.get("query_text", "").strip()]
-                        if rows:
-                            with st.spinner(f"Uploading {len(rows)} queries..."):
-                                added, skipped = add_queries(token, project["id"], rows)
-                            msg = f"Added {added} queries."
-                            if skipped:
-                                msg += f" {skipped} duplicates skipped."
-                            st.success(msg)
-                            st.rerun()
-                        else:
-                            st.warning("CSV had no valid rows.")
-                except Exception as e:
-                    st.error(f"CSV upload failed: {e}")
-
-        st.caption("💡 Write queries as natural language — the way someone would type them into ChatGPT or Perplexity. For example: \"who are the leading CDP experts in the UK\" rather than \"CDP expert + UK\". Personal name queries like \"who is Pal Erik Waagbo\" work as-is. Queries are sent to the AI engine exactly as written — no preprocessing is applied.")
-
-        # Query list with multiselect and bulk delete
-        if queries:
-            st.divider()
-            st.subheader("Queries")
-
-            # Category filter
-            all_categories = sorted(set(q["category"] for q in queries))
-            cat_options = ["All categories"] + all_categories
-            selected_cat = st.selectbox("Filter by category", cat_options, key="query_cat_filter")
-
-            visible_queries = queries if selected_cat == "All categories" else [
-                q for q in queries if q["category"] == selected_cat
-            ]
-
-            # Initialise selection set
-            if "selected_query_ids" not in st.session_state:
-                st.session_state["selected_query_ids"] = set()
-
-            # Select all / Deselect all
-            visible_ids = {q["id"] for q in visible_queries}
-            currently_selected = st.session_state["selected_query_ids"] & visible_ids
-            all_selected = len(currently_selected) == len(visible_ids) and len(visible_ids) > 0
-
-            col_sel, col_count = st.columns([1, 3])
-            with col_sel:
-                if all_selected:
-                    if st.button("Deselect all", key="btn_deselect_all"):
-                        st.session_state["selected_query_ids"] -= visible_ids
-                        for qid in visible_ids:
-                            st.session_state.pop(f"cb_{qid}", None)
-                        st.rerun()
-                else:
-                    if st.button("Select all", key="btn_select_all"):
-                        st.session_state["selected_query_ids"] |= visible_ids
-                        for qid in visible_ids:
-                            st.session_state.pop(f"cb_{qid}", None)
-                        st.rerun()
-            with col_count:
-                n_selected = len(currently_selected)
-                if n_selected > 0:
-                    st.caption(f"{n_selected} selected")
-
-            # Bulk delete button + confirmation
-            if n_selected > 0:
-                if st.session_state.get("_confirm_bulk_delete"):
-                    st.warning(f"Delete {n_selected} keywords? This cannot be undone.")
-                    col_yes, col_no = st.columns(2)
-                    with col_yes:
-                        if st.button("Yes, delete", key="btn_confirm_delete", type="primary"):
-                            deleted = delete_queries_bulk(token, list(currently_selected))
-                            st.session_state["selected_query_ids"] -= currently_selected
-                            st.session_state["_confirm_bulk_delete"] = False
-                            if deleted:
-                                st.success(f"Deleted {deleted} keywords.")
-                            st.rerun()
-                    with col_no:
-                        if st.button("Cancel", key="btn_cancel_delete"):
-                            st.session_state["_confirm_bulk_delete"] = False
-                            st.rerun()
-                else:
-                    if st.button(f"Delete selected ({n_selected})", key="btn_bulk_delete"):
-                        st.session_state["_confirm_bulk_delete"] = True
-                        st.rerun()
-
-            # Query rows with checkboxes
-            for q in visible_queries:
-                col_cb, col_text, col_cat, col_del = st.columns([0.5, 4, 2, 1])
-                is_checked = q["id"] in st.session_state["selected_query_ids"]
-                with col_cb:
-                    new_val = st.checkbox("", value=is_checked, key=f"cb_{q['id']}", label_visibility="collapsed")
-                    if new_val and not is_checked:
-                        st.session_state["selected_query_ids"].add(q["id"])
-                    elif not new_val and is_checked:
-                        st.session_state["selected_query_ids"].discard(q["id"])
-                col_text.text(q["query_text"])
-                col_cat.text(q["category"])
-                if col_del.button("Delete", key=f"del_{q['id']}"):
-                    if delete_query(token, q["id"]):
-                        st.session_state["selected_query_ids"].discard(q["id"])
-                        st.rerun()
+    _manage_queries_fragment(token, project, queries)
 
 
 # --- Main ---
@@ -18,18 +18,9 @@ def _get_secret(key: str) -> str:
 
 
 def _refresh_jwt() -> str | None:
-    """Refresh JWT via supabase client. Returns new token or None."""
-    try:
-        from supabase import create_client
-        sb = create_client(_get_secret("SUPABASE_URL"), _get_secret("SUPABASE_ANON_KEY"))
-        response = sb.auth.refresh_session()
-        if response and response.session:
-            new_token = response.session.access_token
-            st.session_state.access_token = new_token
-            return new_token
-    except Exception:
-        pass
-    return None
+    """Refresh JWT via the suite's auth helper. Returns new token or None."""
+    from app import refresh_jwt
+    return refresh_jwt()
 
 
 def _db_get(token: str, table: str, params: dict) -> list[dict]:
@@ -143,12 +143,9 @@ def save_analysis(
         )
         if r.status_code == 401:
             try:
-                from supabase import create_client
-                sb = create_client(supabase_url, anon_key)
-                resp = sb.auth.refresh_session()
-                if resp and resp.session:
-                    new_token = resp.session.access_token
-                    st.session_state.access_token = new_token
+                from app import refresh_jwt
+                new_token = refresh_jwt()
+                if new_token:
                     headers["Authorization"] = f"Bearer {new_token}"
                     r = httpx.post(
                         f"{supabase_url}/rest/v1/crawl_ai_analysis",
@@ -455,6 +455,7 @@ def _run_strategy_generation(project_ctx: dict, token: str) -> None:
                 # Clear stale caches so overview + banner pick up new strategy
                 st.session_state.pop(f"_domain_strategy_{project_id}", None)
                 st.session_state.pop(f"_overview_data_{project_id}", None)
+                st.session_state["_projects_stale"] = True
                 _strategy_saved = True
             else:
                 st.warning("Strategy generated but failed to save.")
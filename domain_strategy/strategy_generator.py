@@ -303,16 +303,9 @@ def save_domain_strategy(token: str, project_id: str, strategy: dict) -> bool:
     if r.status_code == 401:
         # Refresh and retry
         try:
-            from supabase import create_client
-            sb = create_client(_get_secret("SUPABASE_URL"), _get_secret("SUPABASE_ANON_KEY"))
-            stored_access = st.session_state.get("access_token")
-            stored_refresh = st.session_state.get("refresh_token")
-            if stored_access and stored_refresh:
-                sb.auth.set_session(stored_access, stored_refresh)
-            resp = sb.auth.refresh_session()
-            if resp and resp.session:
-                new_token = resp.session.access_token
-                st.session_state.access_token = new_token
+            from app import refresh_jwt
+            new_token = refresh_jwt()
+            if new_token:
                 headers["Authorization"] = f"Bearer {new_token}"
                 r = httpx.patch(url, headers=headers,
                                 params={"id": f"eq.{project_id}"},
@@ -0,0 +1,49 @@
+-- Migration 014: Unique query text per project
+-- add_queries() inserts the whole batch in one request with
+-- on_conflict=project_id,query_text and resolution=ignore-duplicates, which
+-- needs a unique index on exactly these columns as the conflict target.
+-- Shared table (GEO Tracker): check with COO (pal-ops chat) before running.
+-- After this, plain INSERTs of an existing (project_id, query_text) fail with
+-- 23505 — GEO Tracker must skip or upsert duplicates the same way.
+
+BEGIN;
+
+-- Existing duplicates: keep the oldest row per (project_id, query_text)
+CREATE TEMP TABLE query_dupes ON COMMIT DROP AS
+SELECT id AS dup_id, keep_id
+FROM (
+    SELECT id,
+           first_value(id) OVER (PARTITION BY project_id, query_text
+                                 ORDER BY created_at, id) AS keep_id
+    FROM queries
+) ranked
+WHERE id <> keep_id;
+
+-- Move the duplicates' citation history onto the kept row, one result per
+-- (engine, check_date) and only where the kept row has none for that day
+UPDATE geo_check_results r
+    SET query_id = m.keep_id
+FROM (
+    SELECT DISTINCT ON (d.keep_id, g.engine, g.check_date) g.id, d.keep_id
+    FROM geo_check_results g
+    JOIN query_dupes d ON g.query_id = d.dup_id
+    WHERE NOT EXISTS (
+        SELECT 1 FROM geo_check_results k
+        WHERE k.query_id = d.keep_id
+          AND k.engine = g.engine
+          AND k.check_date = g.check_date
+    )
+    ORDER BY d.keep_id, g.engine, g.check_date, g.id
+) m
+WHERE r.id = m.id;
+
+DELETE FROM geo_check_results r USING query_dupes d WHERE r.query_id = d.dup_id;
+DELETE FROM queries q USING query_dupes d WHERE q.id = d.dup_id;
+
+CREATE UNIQUE INDEX IF NOT EXISTS queries_project_id_query_text_key
+    ON queries (project_id, query_text);
+
+COMMIT;
+
+-- Reload PostgREST schema cache
+NOTIFY pgrst, 'reload schema';
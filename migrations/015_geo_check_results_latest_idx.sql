@@ -0,0 +1,8 @@
+-- Migration 015: Index for "latest check day" lookups
+-- The Rank Tracker reads the newest check_date per project (ORDER BY
+-- check_date DESC LIMIT 1), then only that day's rows (check_date = ...).
+-- Both are served by this index instead of scanning the project's history.
+-- Shared table (GEO Tracker): check with COO (pal-ops chat) before running.
+
+CREATE INDEX IF NOT EXISTS idx_geo_check_results_project_date
+    ON geo_check_results (project_id, check_date DESC);
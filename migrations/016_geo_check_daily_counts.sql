@@ -0,0 +1,28 @@
+-- Migration 016: Per-day citation counts for the Rank Tracker trend chart
+-- The dashboard used to download every geo_check_results row of a project
+-- just to count results per check_date. This returns one row per check day.
+-- SECURITY INVOKER, so the existing geo_check_results RLS policies apply.
+-- Adds a function only; no table or data changes. Until it is run the app
+-- falls back to counting the (check_date, appears) rows itself.
+-- Shared Supabase project (GEO Tracker, AEO Audit Agent): check with COO
+-- (pal-ops chat) before running.
+
+CREATE OR REPLACE FUNCTION geo_check_daily_counts(p_project_id uuid)
+RETURNS TABLE (check_date date, total integer, cited integer)
+LANGUAGE sql
+STABLE
+SECURITY INVOKER
+AS $$
+    SELECT r.check_date::date,
+           count(*)::integer,
+           (count(*) FILTER (WHERE r.appears))::integer
+    FROM geo_check_results r
+    WHERE r.project_id = p_project_id
+    GROUP BY r.check_date
+    ORDER BY r.check_date;
+$$;
+
+GRANT EXECUTE ON FUNCTION geo_check_daily_counts(uuid) TO authenticated;
+
+-- Reload PostgREST schema cache
+NOTIFY pgrst, 'reload schema';
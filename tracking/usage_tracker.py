@@ -16,26 +16,8 @@ def _get_secret(key: str) -> str:
 
 def _refresh_jwt() -> str | None:
     """Refresh Supabase JWT. Returns new token or None."""
-    try:
-        from supabase import create_client
-        url = _get_secret("SUPABASE_URL")
-        anon = _get_secret("SUPABASE_ANON_KEY")
-        sb = create_client(url, anon)
-        stored_access = st.session_state.get("access_token")
-        stored_refresh = st.session_state.get("refresh_token")
-        if stored_access and stored_refresh:
-            try:
-                sb.auth.set_session(stored_access, stored_refresh)
-            except Exception:
-                pass
-        resp = sb.auth.refresh_session()
-        if resp and resp.session:
-            st.session_state["access_token"] = resp.session.access_token
-            st.session_state["refresh_token"] = resp.session.refresh_token
-            return resp.session.access_token
-    except Exception:
-        pass
-    return None
+    from app import refresh_jwt
+    return refresh_jwt()
 
 
 def log_usage_event(